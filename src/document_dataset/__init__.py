@@ -1,3 +1,4 @@
 from .dataset import DocumentSample, DocumentDataset, DocumentSamplesList
 from .load_dataset import load_dataset
 from .process import process_dataset
+from .shared import freeze_dataset, attach_dataset
@@ -174,6 +174,9 @@ class DocumentDataset:
     tag_format: str
     labels: dict
     citation: str = ""
+    directory: str = ""
+    resize_images: bool = True
+    files_state: dict = dataclasses.field(default_factory=dict, repr=False)
 
     def __repr__(self):
         repr = f"Dataset name: {self.name}\n"
@@ -184,3 +187,7 @@ class DocumentDataset:
 
     def __getitem__(self, item):
         return self.splits[item]
+
+    def refresh(self) -> dict[str, list[str]]:
+        from .load_dataset import refresh_dataset
+        return refresh_dataset(self)
@@ -17,3 +17,28 @@ def decode_input_ids(input_ids, tokenizer):
     ]
     if len(input_ids) == len(words):
         return words
+
+
+def merge_chunks_predictions(chunks, predictions) -> dict[str, dict[int, int]]:
+    """Merge token predictions of the windows built by `process_sample_chunks`
+    back to word predictions of their source samples. A word seen in more than
+    one window takes the prediction of the window where it has most context,
+    i.e. where its first token is farthest from the window edges."""
+    merged = {}
+    for chunk, chunk_predictions in zip(chunks, predictions):
+        word_ids = chunk["word_ids"]
+        tokens_count = sum(word_id != -1 for word_id in word_ids)
+        source_predictions = merged.setdefault(chunk["source_id"], {})
+        for i, word_id in enumerate(word_ids):
+            if word_id == -1 or (i > 0 and word_ids[i - 1] == word_id):
+                continue
+            context = min(i - 1, tokens_count - i)
+            if word_id not in source_predictions or \
+               context > source_predictions[word_id][0]:
+                source_predictions[word_id] = (context, chunk_predictions[i])
+    return {
+        source_id: {
+            word_id: prediction
+            for word_id, (_, prediction) in sorted(source_predictions.items())
+        } for source_id, source_predictions in merged.items()
+    }
@@ -3,6 +3,7 @@ import json
 import os
 import PIL.Image
 import copy
+import hashlib
 
 from .dataset import DocumentSample, DocumentDataset, DocumentSamplesList
 from .encode_decode import normalize_boxes, resize_image
@@ -130,32 +131,63 @@ def load_splits(samples, dataset_info):
     return dataset_splits
 
 
-def load_dataset(dataset_directory, tag_format="IOB2", resize_images=True):
-    document_samples = DocumentSamplesList()
+def find_sample_files(dataset_directory) -> dict[str, tuple[str, str]]:
     datas_directory = f"{dataset_directory}/data/"
     images_directory = f"{dataset_directory}/image/"
-    data_files = sorted(os.listdir(datas_directory))
-    with tqdm.tqdm(desc="Loading dataset", total=len(data_files)) as pbar:
-        for data_file in data_files:
-            id, _ = data_file.split(".")
-            image_directory = None
-            data_directory = f"{datas_directory}/{id}.{DATA_FORMAT}"
-            for image_extension in IMAGE_EXTENSIONS:
-                image_directory = f"{images_directory}/{id}.{image_extension}"
-                if check_data_directory(
-                        data_directory) and check_image_directory(
-                            image_directory):
-                    break
-            if image_directory is None:
-                raise BaseException(
-                    f"Image format not supported! Must be one of {IMAGE_EXTENSIONS}"
-                )
+    sample_files = {}
+    for data_file in sorted(os.listdir(datas_directory)):
+        id, _ = data_file.split(".")
+        image_directory = None
+        data_directory = f"{datas_directory}/{id}.{DATA_FORMAT}"
+        for image_extension in IMAGE_EXTENSIONS:
+            image_directory = f"{images_directory}/{id}.{image_extension}"
+            if check_data_directory(data_directory) and check_image_directory(
+                    image_directory):
+                break
+        if image_directory is None:
+            raise BaseException(
+                f"Image format not supported! Must be one of {IMAGE_EXTENSIONS}"
+            )
+        sample_files[id] = (data_directory, image_directory)
+    return sample_files
+
+
+def file_stat(file_directory) -> tuple[int, int]:
+    stat = os.stat(file_directory)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def file_hash(file_directory) -> str:
+    file_hash = hashlib.sha256()
+    with open(file_directory, "rb") as fp:
+        for chunk in iter(lambda: fp.read(1 << 20), b""):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+
+def sample_files_state(data_directory, image_directory, with_hash=False):
+    return {
+        "files": (data_directory, image_directory),
+        "stat": (file_stat(data_directory), file_stat(image_directory)),
+        "hash": (file_hash(data_directory),
+                 file_hash(image_directory)) if with_hash else None
+    }
+
+
+def load_dataset(dataset_directory, tag_format="IOB2", resize_images=True):
+    document_samples = DocumentSamplesList()
+    files_state = {}
+    sample_files = find_sample_files(dataset_directory)
+    with tqdm.tqdm(desc="Loading dataset", total=len(sample_files)) as pbar:
+        for id, (data_directory, image_directory) in sample_files.items():
             sample = load_sample(data_directory=data_directory,
                                  image_directory=image_directory,
                                  tag_format=tag_format,
                                  id=id,
                                  resize_images=resize_images)
             document_samples.append(sample)
+            files_state[id] = sample_files_state(data_directory,
+                                                 image_directory)
             pbar.update()
     labels = document_samples.extract_samples_labels()
     dataset_info = load_dataset_info(dataset_directory)
@@ -164,5 +196,117 @@ def load_dataset(dataset_directory, tag_format="IOB2", resize_images=True):
                               samples=document_samples,
                               splits=dataset_splits,
                               tag_format=tag_format,
-                              labels=labels)
+                              labels=labels,
+                              directory=dataset_directory,
+                              resize_images=resize_images,
+                              files_state=files_state)
     return dataset
+
+
+def find_splits_ids(splits_info) -> set[str]:
+    ids = set()
+    if isinstance(splits_info, dict):
+        for value in splits_info.values():
+            ids |= find_splits_ids(value)
+    elif isinstance(splits_info, list):
+        ids.update(splits_info)
+    return ids
+
+
+def update_splits(splits, new_splits):
+    for key in list(splits.keys()):
+        if key not in new_splits:
+            del splits[key]
+    for key, new_split in new_splits.items():
+        split = splits.get(key)
+        if isinstance(split, dict) and isinstance(new_split, dict):
+            update_splits(split, new_split)
+        elif isinstance(split, DocumentSamplesList) and isinstance(
+                new_split, DocumentSamplesList):
+            split[:] = new_split
+            split.samples_map = new_split.samples_map
+        else:
+            splits[key] = new_split
+
+
+def refresh_dataset(dataset: DocumentDataset) -> dict[str, list[str]]:
+    """Reload only the samples whose files were added, changed or deleted.
+
+    A sample is considered changed when the modification time or size of its
+    data or image file differs from the loaded one and its contents hash
+    differs as well. Hashes are only computed once a file's stat changes, so
+    the first `touch` after `load_dataset` still reloads the sample.
+
+    Everything is loaded and validated before the dataset is touched, so a
+    failing refresh leaves it as it was. `samples`, `labels` and the split
+    lists are then updated in place, so references to them stay current.
+    """
+    if not dataset.directory:
+        raise BaseException("Dataset was not loaded from a directory!")
+    sample_files = find_sample_files(dataset.directory)
+    files_state = dict(dataset.files_state)
+
+    added, changed = [], []
+    for id, (data_directory, image_directory) in sample_files.items():
+        state = files_state.get(id)
+        if state is None:
+            added.append(id)
+            continue
+        new_state = sample_files_state(data_directory, image_directory)
+        if state["files"] == new_state["files"] and \
+           state["stat"] == new_state["stat"]:
+            continue
+        new_state = sample_files_state(data_directory,
+                                       image_directory,
+                                       with_hash=True)
+        if state["files"] == new_state["files"] and \
+           state["hash"] == new_state["hash"]:
+            files_state[id] = new_state
+            continue
+        changed.append(id)
+    deleted = [id for id in files_state.keys() if id not in sample_files]
+
+    dataset_info = load_dataset_info(dataset.directory)
+    missing_ids = find_splits_ids(dataset_info[INFO_SPLITS]) - set(
+        sample_files.keys())
+    if missing_ids:
+        raise KeyError(
+            f"Splits reference samples that do not exist: {sorted(missing_ids)}"
+        )
+
+    loaded_samples = {}
+    to_load = added + changed
+    with tqdm.tqdm(desc="Refreshing dataset", total=len(to_load)) as pbar:
+        for id in to_load:
+            data_directory, image_directory = sample_files[id]
+            loaded_samples[id] = load_sample(
+                data_directory=data_directory,
+                image_directory=image_directory,
+                tag_format=dataset.tag_format,
+                id=id,
+                resize_images=dataset.resize_images)
+            files_state[id] = sample_files_state(data_directory,
+                                                 image_directory,
+                                                 with_hash=True)
+            pbar.update()
+    for id in deleted:
+        del files_state[id]
+
+    samples = dataset.samples
+    samples_by_id = {sample.id: sample for sample in samples}
+    samples_by_id.update(loaded_samples)
+    new_samples = DocumentSamplesList(
+        [samples_by_id[id] for id in sample_files.keys()])
+    labels = new_samples.extract_samples_labels()
+    dataset_splits = load_splits(new_samples, dataset_info)
+
+    dataset.files_state.clear()
+    dataset.files_state.update(files_state)
+    samples[:] = new_samples
+    samples.samples_map = new_samples.samples_map
+    dataset.labels.clear()
+    dataset.labels.update(labels)
+    dataset.name = dataset_info[INFO_NAME]
+    update_splits(dataset.splits, dataset_splits)
+
+    return {"added": added, "changed": changed, "deleted": deleted}
@@ -56,6 +56,17 @@ def process_words_boxes_labels(sample,
                 words2input_ids[i] = (len(input_ids) - len(tokens),
                                       len(input_ids) - 1)
 
+    input_ids, bbox, processed_labels, attention_mask = add_special_tokens_and_padding(
+        input_ids, bbox, processed_labels, attention_mask, tokenizer,
+        max_lenght)
+
+    return input_ids, bbox, processed_labels, attention_mask, words2input_ids
+
+
+def add_special_tokens_and_padding(input_ids, bbox, processed_labels,
+                                   attention_mask, tokenizer, max_lenght):
+    max_lenght_without_special = max_lenght - 2
+
     # postprocessing
     while (len(input_ids) != max_lenght_without_special):
         input_ids.append(tokenizer.pad_token_id)
@@ -68,7 +79,105 @@ def process_words_boxes_labels(sample,
     processed_labels = [CLS_LABEL] + processed_labels + [SEP_LABEL]
     attention_mask = [0] + attention_mask + [0]
 
-    return input_ids, bbox, processed_labels, attention_mask, words2input_ids
+    return input_ids, bbox, processed_labels, attention_mask
+
+
+def tokenize_words(sample, tokenizer, lowercase_all_words=False):
+    words = sample.words
+    if lowercase_all_words:
+        words = [word.lower() for word in words]
+    return [
+        tokenizer.convert_tokens_to_ids(tokenizer.tokenize(word))
+        for word in words
+    ]
+
+
+def split_words_in_chunks(words_input_ids,
+                          max_lenght=MAX_LENGHT,
+                          stride=0) -> list[tuple[int, int]]:
+    """Split the words of a page in windows of at most `max_lenght - 2`
+    tokens, on word boundaries, with consecutive windows sharing up to
+    `stride` tokens. Returns the `(start, end)` word range of each window,
+    `end` exclusive. A page without words gets a single empty window and
+    windows that would fall inside the previous one are skipped."""
+    max_lenght_without_special = max_lenght - 2
+    if stride >= max_lenght_without_special:
+        raise ValueError(
+            f"Stride must be lower than {max_lenght_without_special}!")
+    if not words_input_ids:
+        return [(0, 0)]
+    chunks = []
+    start = 0
+    while start < len(words_input_ids):
+        end = start
+        lenght = 0
+        while end < len(words_input_ids) and \
+              lenght + len(words_input_ids[end]) <= max_lenght_without_special:
+            lenght += len(words_input_ids[end])
+            end += 1
+        if end == start:
+            # a single word longer than the window is truncated
+            end = start + 1
+        if not chunks or end > chunks[-1][1]:
+            chunks.append((start, end))
+        if end == len(words_input_ids):
+            break
+        next_start = end
+        overlap = 0
+        while next_start - 1 > start and \
+              overlap + len(words_input_ids[next_start - 1]) <= stride:
+            overlap += len(words_input_ids[next_start - 1])
+            next_start -= 1
+        start = next_start
+    return chunks
+
+
+def process_words_boxes_labels_chunks(sample,
+                                      tokenizer,
+                                      label2id,
+                                      max_lenght=MAX_LENGHT,
+                                      stride=0,
+                                      lowercase_all_words=False):
+    """Encode every word of the sample in as many windows as needed instead
+    of truncating. Words are tokenized once per page and the windows slice
+    the result. Besides the outputs of `process_words_boxes_labels`, each
+    window carries `word_ids`, the source word index of each token (`-1` for
+    special and padding tokens)."""
+    max_lenght_without_special = max_lenght - 2
+
+    words_input_ids = tokenize_words(sample, tokenizer, lowercase_all_words)
+    words_boxes = normalize_boxes(sample.boxes, sample.image)
+    words_labels = labels_to_ids(sample.labels, label2id)
+
+    chunks = []
+    for start, end in split_words_in_chunks(words_input_ids, max_lenght,
+                                            stride):
+        input_ids = []
+        bbox = []
+        processed_labels = []
+        attention_mask = []
+        word_ids = []
+        words2input_ids = {}
+        for i in range(start, end):
+            tokens = words_input_ids[i]
+            tokens = tokens[:max_lenght_without_special - len(input_ids)]
+            if not tokens:
+                continue
+            input_ids += tokens
+            bbox += [words_boxes[i]] * len(tokens)
+            processed_labels += [words_labels[i]] * len(tokens)
+            attention_mask += [1] * len(tokens)
+            word_ids += [i] * len(tokens)
+            words2input_ids[i] = (len(input_ids) - len(tokens),
+                                  len(input_ids) - 1)
+        input_ids, bbox, processed_labels, attention_mask = add_special_tokens_and_padding(
+            input_ids, bbox, processed_labels, attention_mask, tokenizer,
+            max_lenght)
+        word_ids = [-1] + word_ids + [-1] * (max_lenght - 1 - len(word_ids))
+        chunks.append((input_ids, bbox, processed_labels, attention_mask,
+                       words2input_ids, word_ids))
+
+    return chunks
 
 
 def process_entities_relations(sample, words2input_ids, label2id,
@@ -171,11 +280,90 @@ def process_sample(sample,
     return processed_sample
 
 
+def find_dropped_relations(sample, windows_words2input_ids,
+                           labels_to_exclude=None) -> dict[str, list[int]]:
+    """Relations of the sample, as source entities indexes, whose two
+    entities do not fit together in any window, so no window encodes them."""
+
+    if labels_to_exclude is None:
+        labels_to_exclude = set()
+
+    entities = sample.entities
+    relations = sample.relations
+    dropped_relations = {"head": [], "tail": []}
+    relations_pairs = set()
+
+    for head, tail in zip(relations["head"], relations["tail"]):
+        if (head, tail) in relations_pairs:
+            continue
+        relations_pairs.add((head, tail))
+        if entities["label"][head] in labels_to_exclude or \
+           entities["label"][tail] in labels_to_exclude:
+            continue
+        words = (entities["start"][head], entities["end"][head],
+                 entities["start"][tail], entities["end"][tail])
+        if not any(
+                all(word in words2input_ids for word in words)
+                for words2input_ids in windows_words2input_ids):
+            dropped_relations["head"].append(head)
+            dropped_relations["tail"].append(tail)
+
+    return dropped_relations
+
+
+def process_sample_chunks(sample,
+                          tokenizer,
+                          id: str,
+                          tc_label2id=None,
+                          re_label2id=None,
+                          max_lenght=MAX_LENGHT,
+                          stride=0,
+                          lowercase_all_words=False,
+                          labels_to_exclude=None) -> list[EncodedDocumentSample]:
+
+    image = encode_image(sample.image)
+    chunks = process_words_boxes_labels_chunks(sample, tokenizer, tc_label2id,
+                                               max_lenght, stride,
+                                               lowercase_all_words)
+
+    dropped_relations = find_dropped_relations(
+        sample, [chunk[4] for chunk in chunks], labels_to_exclude)
+
+    processed_samples = []
+    for chunk_index, chunk in enumerate(chunks):
+        input_ids, bbox, labels, attention_mask, words2input_ids, word_ids = chunk
+        entities, relations = process_entities_relations(
+            sample, words2input_ids, re_label2id, labels_to_exclude)
+        processed_sample = EncodedDocumentSample(id=f"{id}_{chunk_index}",
+                                                 input_ids=input_ids,
+                                                 bbox=bbox,
+                                                 labels=labels,
+                                                 image=image,
+                                                 entities=entities,
+                                                 relations=relations,
+                                                 attention_mask=attention_mask)
+        processed_sample["source_id"] = id
+        processed_sample["chunk_index"] = chunk_index
+        processed_sample["word_ids"] = word_ids
+        processed_sample["dropped_relations"] = dropped_relations
+        processed_samples.append(processed_sample)
+
+    return processed_samples
+
+
 def process_dataset(dataset: DocumentDataset,
                     splits: list[list[str]],
                     tokenizer,
                     labels_to_exclude=None,
-                    lowercase_all_words=False) -> DocumentSamplesList:
+                    lowercase_all_words=False,
+                    stride=None) -> DocumentSamplesList:
+    """Encode the samples of the given splits. By default only words inside
+    entities are encoded and truncated to `MAX_LENGHT`; with a `stride`, every
+    word is encoded in overlapping windows of `MAX_LENGHT` tokens, each one
+    a separate sample (see `process_sample_chunks`). A relation is only
+    encoded in a window holding both of its entities; the ones that fit in no
+    window are listed in the `dropped_relations` of every window of the
+    page."""
 
     documents_samples_lists: list[DocumentSamplesList] = list()
     for split in splits:
@@ -197,6 +385,20 @@ def process_dataset(dataset: DocumentDataset,
     with tqdm.tqdm(desc="Processing dataset",
                    total=len(samples_to_process)) as pbar:
         for sample in samples_to_process:
+            if stride is not None:
+                for processed_sample in process_sample_chunks(
+                        sample,
+                        tokenizer,
+                        id=sample.id,
+                        tc_label2id=tc_label2id,
+                        re_label2id=re_label2id,
+                        max_lenght=MAX_LENGHT,
+                        stride=stride,
+                        labels_to_exclude=labels_to_exclude,
+                        lowercase_all_words=lowercase_all_words):
+                    processed_dataset.append(processed_sample)
+                pbar.update()
+                continue
             processed_sample = process_sample(
                 sample,
                 tokenizer,
@@ -0,0 +1,377 @@
+import json
+import multiprocessing.resource_tracker
+import multiprocessing.shared_memory
+import struct
+
+import numpy
+import PIL.Image
+
+from .dataset import DocumentSample, DocumentDataset
+from .encode_decode import CHANNEL_COUNT
+
+HEADER_SIZE_FORMAT = "<Q"
+HEADER_SIZE_BYTES = struct.calcsize(HEADER_SIZE_FORMAT)
+ALIGNMENT = 8
+SPLIT_SAMPLES = "samples"
+SPLIT_VALUE = "value"
+
+
+def attach_shared_memory(name):
+    """Attach to an existing block without tracking it, only the process
+    that created the block owns it and unlinks it.
+
+    Before python 3.13 attaching always registers the block in the resource
+    tracker, which would unlink it when the attaching process exits. Workers
+    share the tracker of their parent, so unregistering afterwards would drop
+    the creator's registration too; instead the registration is skipped."""
+    try:
+        return multiprocessing.shared_memory.SharedMemory(name=name,
+                                                          track=False)
+    except TypeError:
+        pass
+    register = multiprocessing.resource_tracker.register
+
+    def register_untracked(name, rtype):
+        if rtype != "shared_memory":
+            register(name, rtype)
+
+    multiprocessing.resource_tracker.register = register_untracked
+    try:
+        return multiprocessing.shared_memory.SharedMemory(name=name)
+    finally:
+        multiprocessing.resource_tracker.register = register
+
+
+def pack_samples(samples, labels) -> tuple[dict[str, numpy.ndarray], list]:
+    """Pack everything but the images in flat arrays. Images are only sized
+    here and returned apart, to be written straight into the shared block."""
+    tc_label2id = labels["tokens"]["label2id"]
+    re_label2id = labels["entities"]["label2id"]
+
+    words_bytes = []
+    words_offsets = [0]
+    boxes = []
+    tokens_labels = []
+    samples_words = [0]
+    entities = {"start": [], "end": [], "label": []}
+    samples_entities = [0]
+    relations = {"head": [], "tail": [], "start_index": [], "end_index": []}
+    samples_relations = [0]
+    images = []
+    images_shapes = []
+    images_offsets = [0]
+
+    for sample in samples:
+        for word in sample.words:
+            word_bytes = word.encode("utf-8")
+            words_bytes.append(word_bytes)
+            words_offsets.append(words_offsets[-1] + len(word_bytes))
+        boxes += sample.boxes
+        tokens_labels += [tc_label2id[label] for label in sample.labels]
+        samples_words.append(samples_words[-1] + len(sample.words))
+        entities["start"] += sample.entities["start"]
+        entities["end"] += sample.entities["end"]
+        entities["label"] += [
+            re_label2id[label] for label in sample.entities["label"]
+        ]
+        samples_entities.append(samples_entities[-1] +
+                                len(sample.entities["start"]))
+        for key in relations.keys():
+            relations[key] += sample.relations[key]
+        samples_relations.append(samples_relations[-1] +
+                                 len(sample.relations["head"]))
+        if sample.image is None:
+            images_shapes.append((0, 0))
+            images_offsets.append(images_offsets[-1])
+        else:
+            width, height = sample.image.size
+            images.append((sample.image, images_offsets[-1]))
+            images_shapes.append((height, width))
+            images_offsets.append(images_offsets[-1] +
+                                  height * width * CHANNEL_COUNT)
+
+    arrays = {
+        "ids": numpy.array([sample.id for sample in samples], "U"),
+        "words": numpy.frombuffer(b"".join(words_bytes), "uint8"),
+        "words_offsets": numpy.array(words_offsets, "int64"),
+        "boxes": numpy.array(boxes).reshape(-1, 4),
+        "labels": numpy.array(tokens_labels, "int64"),
+        "samples_words": numpy.array(samples_words, "int64"),
+        "samples_entities": numpy.array(samples_entities, "int64"),
+        "samples_relations": numpy.array(samples_relations, "int64"),
+        "images_shapes": numpy.array(images_shapes, "int64").reshape(-1, 2),
+        "images_offsets": numpy.array(images_offsets, "int64"),
+    }
+    for key, values in entities.items():
+        arrays[f"entities_{key}"] = numpy.array(values, "int64")
+    for key, values in relations.items():
+        arrays[f"relations_{key}"] = numpy.array(values, "int64")
+    arrays["ids_order"] = numpy.argsort(arrays["ids"], kind="stable")
+    return arrays, images
+
+
+def pack_splits(splits, samples_index, arrays, path="splits"):
+    if isinstance(splits, dict):
+        return {
+            key: pack_splits(value, samples_index, arrays, f"{path}/{key}")
+            for key, value in splits.items()
+        }
+    if isinstance(splits, list):
+        arrays[path] = numpy.array(
+            [samples_index[sample.id] for sample in splits], "int64")
+        return (SPLIT_SAMPLES, path)
+    return (SPLIT_VALUE, splits)
+
+
+class SharedDocumentSamplesList:
+    """Read-only view over samples stored in a `SharedDocumentDataset`.
+
+    Samples are rebuilt as `DocumentSample`s on access, so nothing but the
+    shared buffer is kept alive across accesses. `indexes` are kept in
+    private memory, so the view stays safe to use after the dataset is
+    closed, raising instead of reading the released buffer."""
+
+    def __init__(self, dataset, indexes=None) -> None:
+        self.dataset = dataset
+        self.indexes = indexes
+        self.sorted_indexes = None
+
+    def __repr__(self):
+        return f"SharedDocumentSamplesList: {len(self)} samples"
+
+    def __len__(self):
+        if self.indexes is None:
+            return self.dataset.samples_count
+        return len(self.indexes)
+
+    def has_index(self, index: int) -> bool:
+        if self.indexes is None:
+            return 0 <= index < len(self)
+        if self.sorted_indexes is None:
+            self.sorted_indexes = numpy.sort(self.indexes)
+        position = numpy.searchsorted(self.sorted_indexes, index)
+        return position < len(self.sorted_indexes) and \
+            self.sorted_indexes[position] == index
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __getitem__(self, item):
+        if isinstance(item, str):
+            index = self.dataset.index(item)
+            if not self.has_index(index):
+                raise KeyError(item)
+            return self.dataset.get_sample(index)
+        if isinstance(item, slice):
+            indexes = numpy.arange(len(self))[item]
+            if self.indexes is not None:
+                indexes = self.indexes[indexes]
+            return SharedDocumentSamplesList(self.dataset, indexes)
+        if item < 0:
+            item += len(self)
+        if not 0 <= item < len(self):
+            raise IndexError("Sample index out of range!")
+        if self.indexes is not None:
+            item = int(self.indexes[item])
+        return self.dataset.get_sample(item)
+
+    @property
+    def ids(self) -> list[str]:
+        ids = self.dataset.get_array("ids")
+        if self.indexes is not None:
+            ids = ids[self.indexes]
+        return ids.tolist()
+
+
+class SharedDocumentDataset:
+    """A `DocumentDataset` frozen into a single shared memory block.
+
+    Pickling only carries the block name, so data loader workers attach to
+    the same memory instead of copying or unpickling the samples. The
+    process that called `freeze_dataset` owns the block and must `unlink`
+    it when done."""
+
+    def __init__(self, shared_memory) -> None:
+        self.shared_memory = shared_memory
+        buffer = shared_memory.buf
+        header_size, = struct.unpack_from(HEADER_SIZE_FORMAT, buffer)
+        header = json.loads(
+            bytes(buffer[HEADER_SIZE_BYTES:HEADER_SIZE_BYTES + header_size]))
+        arrays_offset = align(HEADER_SIZE_BYTES + header_size)
+        self.name = header["name"]
+        self.tag_format = header["tag_format"]
+        self.labels = header["labels"]
+        # json turns the integer keys of id2label into strings
+        for labels in self.labels.values():
+            labels["id2label"] = {
+                int(id): label
+                for id, label in labels["id2label"].items()
+            }
+        self.citation = header["citation"]
+        self.arrays = {}
+        for key, (dtype, shape, offset) in header["arrays"].items():
+            array = numpy.ndarray(shape, dtype, buffer, arrays_offset + offset)
+            array.flags.writeable = False
+            self.arrays[key] = array
+        self.samples_count = len(self.arrays["ids"])
+        self.tc_id2label = self.labels["tokens"]["labels"]
+        self.re_id2label = self.labels["entities"]["labels"]
+        self.samples = SharedDocumentSamplesList(self)
+        self.splits = self.load_splits(header["splits"])
+
+    def __repr__(self):
+        repr = f"Dataset name: {self.name}\n"
+        repr += f"Tag format: {self.tag_format}\n"
+        repr += f"Labels: {self.labels}\n"
+        repr += f"Shared memory: {self.shared_memory.name}"
+        return repr
+
+    def __getitem__(self, item):
+        return self.splits[item]
+
+    def __getstate__(self):
+        return {"shared_memory_name": self.shared_memory.name}
+
+    def __setstate__(self, state):
+        shared_memory = attach_shared_memory(state["shared_memory_name"])
+        self.__init__(shared_memory)
+
+    def load_splits(self, splits):
+        if isinstance(splits, dict):
+            return {
+                key: self.load_splits(value)
+                for key, value in splits.items()
+            }
+        kind, value = splits
+        if kind == SPLIT_SAMPLES:
+            return SharedDocumentSamplesList(self, self.arrays.pop(value).copy())
+        return value
+
+    def get_array(self, key: str) -> numpy.ndarray:
+        if not self.arrays:
+            raise ValueError("Shared dataset is closed!")
+        return self.arrays[key]
+
+    def index(self, id: str) -> int:
+        ids = self.get_array("ids")
+        ids_order = self.get_array("ids_order")
+        position = numpy.searchsorted(ids, id, sorter=ids_order)
+        if position < len(ids) and ids[ids_order[position]] == id:
+            return int(ids_order[position])
+        raise KeyError(id)
+
+    def get_sample(self, index: int) -> DocumentSample:
+        self.get_array("ids")
+        arrays = self.arrays
+        words_start, words_end = arrays["samples_words"][index:index + 2]
+        words_offsets = arrays["words_offsets"][words_start:words_end + 1]
+        words_bytes = arrays["words"][words_offsets[0]:words_offsets[-1]]
+        words_bytes = words_bytes.tobytes()
+        words_offsets = (words_offsets - words_offsets[0]).tolist()
+        words = [
+            words_bytes[words_offsets[i]:words_offsets[i + 1]].decode("utf-8")
+            for i in range(len(words_offsets) - 1)
+        ]
+        boxes = arrays["boxes"][words_start:words_end].tolist()
+        labels = [
+            self.tc_id2label[label]
+            for label in arrays["labels"][words_start:words_end].tolist()
+        ]
+
+        start, end = arrays["samples_entities"][index:index + 2]
+        entities = {
+            "start": arrays["entities_start"][start:end].tolist(),
+            "end": arrays["entities_end"][start:end].tolist(),
+            "label": [
+                self.re_id2label[label]
+                for label in arrays["entities_label"][start:end].tolist()
+            ]
+        }
+
+        start, end = arrays["samples_relations"][index:index + 2]
+        relations = {
+            key: arrays[f"relations_{key}"][start:end].tolist()
+            for key in ["head", "tail", "start_index", "end_index"]
+        }
+
+        image = None
+        height, width = arrays["images_shapes"][index]
+        if height and width:
+            start, end = arrays["images_offsets"][index:index + 2]
+            image = PIL.Image.fromarray(
+                arrays["images"][start:end].reshape(height, width, 3), "RGB")
+
+        return DocumentSample(id=str(arrays["ids"][index]),
+                              words=words,
+                              boxes=boxes,
+                              labels=labels,
+                              entities=entities,
+                              relations=relations,
+                              image=image)
+
+    def close(self):
+        # split views hold private copies of their indexes, every read of the
+        # buffer goes through `arrays`, which raises once emptied
+        self.arrays = {}
+        self.shared_memory.close()
+
+    def unlink(self):
+        self.shared_memory.unlink()
+
+
+def align(offset: int) -> int:
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def freeze_dataset(dataset: DocumentDataset) -> SharedDocumentDataset:
+    """Copy the dataset into a new shared memory block. The calling process
+    owns the block: it must `unlink` it once every worker is done, attaching
+    processes never unlink it."""
+    arrays, images = pack_samples(dataset.samples, dataset.labels)
+    samples_index = {
+        sample.id: i
+        for i, sample in enumerate(dataset.samples)
+    }
+    splits = pack_splits(dataset.splits, samples_index, arrays)
+
+    header = {
+        "name": dataset.name,
+        "tag_format": dataset.tag_format,
+        "labels": dataset.labels,
+        "citation": dataset.citation,
+        "splits": splits,
+        "arrays": {}
+    }
+    arrays_size = 0
+    for key, array in arrays.items():
+        header["arrays"][key] = (array.dtype.str, array.shape, arrays_size)
+        arrays_size += align(array.nbytes)
+    images_size = int(arrays["images_offsets"][-1])
+    header["arrays"]["images"] = ("|u1", (images_size, ), arrays_size)
+    arrays_size += align(images_size)
+    header_bytes = json.dumps(header).encode("utf-8")
+    arrays_offset = align(HEADER_SIZE_BYTES + len(header_bytes))
+
+    shared_memory = multiprocessing.shared_memory.SharedMemory(
+        create=True, size=max(arrays_offset + arrays_size, 1))
+    buffer = shared_memory.buf
+    struct.pack_into(HEADER_SIZE_FORMAT, buffer, 0, len(header_bytes))
+    buffer[HEADER_SIZE_BYTES:HEADER_SIZE_BYTES +
+           len(header_bytes)] = header_bytes
+    for key, array in arrays.items():
+        _, shape, offset = header["arrays"][key]
+        numpy.ndarray(shape, array.dtype, buffer,
+                      arrays_offset + offset)[...] = array
+    _, _, offset = header["arrays"]["images"]
+    images_array = numpy.ndarray((images_size, ), "uint8", buffer,
+                                 arrays_offset + offset)
+    for image, start in images:
+        image = numpy.asarray(image.convert("RGB"), "uint8").reshape(-1)
+        images_array[start:start + image.size] = image
+    del images_array
+    return SharedDocumentDataset(shared_memory)
+
+
+def attach_dataset(name: str) -> SharedDocumentDataset:
+    return SharedDocumentDataset(attach_shared_memory(name))